@@ -0,0 +1,281 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from google_sheets import get_sheetid
+from mvp_sheets import build_tomorrow_sheet, find_open_slots, find_player_slots, get_both_sheets, get_todays_sheet, get_tomorrows_date, \
+    group_by_day, load_schedule, schedule_lookahead
+from utilities import MVPTimes, SlotKey, get_emojis
+
+# Default timezones to empty dictionary to be loaded later
+timezones = {}
+
+col_to_tz = {
+    7: 'PST',
+    8: 'PDT',
+    9: 'CST',
+    10: 'CDT',
+    11: 'EST',
+    12: 'EDT',
+    13: 'CEST',
+    14: 'CEDT',
+    15: 'AEST',
+    16: 'AEDT',
+}
+
+
+# Limits discord places on the size of an embed
+title_limit = 256
+field_name_limit = 256
+field_value_limit = 1024
+field_limit = 25
+embed_limit = 6000
+# Room left in the title of every page for the page number
+page_number_size = len(' • 99/99')
+
+
+class EmbedLayout:
+    """
+    Class for packing embed fields into as many embeds as needed to stay under discord's limits
+    """
+
+    def __init__(self, title, description=''):
+        self.title: str = title[:title_limit - page_number_size]
+        self.description: str = description
+        self.pages = [[]]
+        self.page_size: int = len(self.title) + page_number_size + len(self.description)
+
+    def add_field(self, name, value, inline=False):
+        name = name[:field_name_limit]
+        value = value[:field_value_limit]
+        field_size = len(name) + len(value)
+
+        # Start a new page if the field would not fit on the current one
+        if len(self.pages[-1]) >= field_limit or self.page_size + field_size > embed_limit:
+            self.pages.append([])
+            self.page_size = len(self.title) + page_number_size
+
+        self.pages[-1].append((name, value, inline))
+        self.page_size += field_size
+
+    def add_lines(self, name, lines, inline=False):
+        """
+        Add lines under a single field name, splitting them over as many fields as needed
+        :param name: The name of the field(s)
+        :param lines: The lines of the field value
+        :param inline: Whether the field(s) are inline
+        :return:
+        """
+        value = ''
+        for line in lines:
+            if value and len(value) + len(line) > field_value_limit:
+                self.add_field(name, value, inline)
+                value = ''
+            value += line
+        if value:
+            self.add_field(name, value, inline)
+
+    def build(self):
+        # Discord is only imported once an embed is needed so that the sheet filtering stays cheap to import
+        from discord import Embed
+
+        embeds = []
+        for page_number, fields in enumerate(self.pages, 1):
+            title = f'{self.title} • {page_number}/{len(self.pages)}' if len(self.pages) > 1 else self.title
+            embed = Embed(title=title)
+            if page_number == 1 and self.description:
+                embed.description = self.description
+            for name, value, inline in fields:
+                embed.add_field(name=name, value=value, inline=inline)
+            embeds.append(embed)
+        return embeds
+
+
+def get_timezone_col(timezone):
+    time = timezones.get(timezone)
+    return time.get('base') + time.get('offset')
+
+
+def build_mvp_embed(date_time, spreadsheet_id, layout=None):
+    Emojis = get_emojis()
+    next_day_trigger = datetime.now(timezone.utc).replace(hour=18, minute=0, second=0)
+
+    if date_time >= next_day_trigger:
+        # If the sheet does not exist yet - build it
+        if not get_sheetid(get_tomorrows_date().strftime('%D'), spreadsheet_id):
+            build_tomorrow_sheet(spreadsheet_id)
+
+        sheet, next_mvp_time, open_slots = get_both_sheets(spreadsheet_id)
+    else:
+        sheet, next_mvp_time, open_slots = get_todays_sheet(spreadsheet_id)
+
+    # Added check to mvp time that it is not None as well as the top_value of the embed
+    if next_mvp_time:
+        next_mvp_parts = str(next_mvp_time).split(':')
+    else:
+        next_mvp_parts = ['--', '--']
+
+    # This find the first ch/map combo in the list that isn't reset and makes it as the announcement
+    for slot in sheet:
+        if slot.key not in (SlotKey.Reset.value, SlotKey.Unscheduled.value):
+            top_value = f'{Emojis.Next.value} Next MVP at **{slot.key}** in ' \
+                        f'{next_mvp_parts[0] + " hours, " if next_mvp_parts[0] != "0" else ""}{next_mvp_parts[1]} minutes'
+            break
+    else:
+        top_value = f'{Emojis.Stopped.value} Next MVP at -- in -- hours, -- minutes'
+
+    if spreadsheet_id == os.getenv('SPREADSHEET_HIGH_LVL_ID'):
+        level_text = 'Anywhere'
+    else:
+        level_text = 'Mushroom Shrine'
+
+    # Create a new layout, else continue adding to the current one
+    if not layout:
+        layout = EmbedLayout(title=f'Upcoming MVPs • <t:{int(date_time.timestamp())}> Local Time')
+
+    layout.add_field(name=Emojis.Spacer.value, value=f'```\n{level_text} MVPs\n```\n{top_value}', inline=False)
+
+    first_set = False
+    for slot in sheet:
+        if SlotKey.Reset.value == slot.key:
+            layout.add_field(name='**Server Reset**', value=f'<t:{int(slot.single_time.timestamp())}:t> Local Time',  inline=False)
+
+        elif SlotKey.Unscheduled.value == slot.key:
+            layout.add_field(name='**Unscheduled**', value=f'<t:{int(slot.start_date.timestamp())}:t> -- <t:{int(slot.last_date.timestamp())}:t> Local Time',
+                             inline=False)
+        else:
+            embed_lines = []
+            for mvp_time in slot.mvp_times:
+                if not first_set:
+                    first_set = True
+                    emoji = Emojis.Next.value
+                else:
+                    emoji = Emojis.Scheduled.value
+                embed_lines.append(f'{emoji} <t:{int(mvp_time["dt"].timestamp())}:t> Local Time\n')
+            layout.add_lines(name=f'**{slot.key} • {"IGN: " + slot.ign + " • " if slot.ign else ""}{"Discord: " + slot.discord if slot.discord else ""}**',
+                             lines=embed_lines, inline=False)
+    return layout
+
+
+def build_mvp_embed_deprecated(date_time, spreadsheet_id, layout=None):
+    Emojis = get_emojis()
+    next_day_trigger = datetime.now(timezone.utc).replace(hour=18, minute=0, second=0)
+
+    if date_time >= next_day_trigger:
+        # If the sheet does not exist yet - build it
+        if not get_sheetid(get_tomorrows_date().strftime('%D'), spreadsheet_id):
+            build_tomorrow_sheet(spreadsheet_id)
+
+        sheet, next_mvp_time, open_slots = get_both_sheets(spreadsheet_id)
+    else:
+        sheet, next_mvp_time, open_slots = get_todays_sheet(spreadsheet_id)
+
+    # Added check to mvp time that it is not None as well as the top_value of the embed
+    if next_mvp_time:
+        next_mvp_parts = str(next_mvp_time).split(':')
+    else:
+        next_mvp_parts = ['--', '--']
+
+    # This find the first ch/map combo in the list that isn't reset and makes it as the announcement
+    for slot in sheet:
+        if slot.key not in (SlotKey.Reset.value, SlotKey.Unscheduled.value):
+            top_value = f'{Emojis.Next.value} Next MVP at **{slot.key}** in ' \
+                        f'{next_mvp_parts[0] + " hours, " if next_mvp_parts[0] != "0" else ""}{next_mvp_parts[1]} minutes'
+            break
+    else:
+        top_value = f'{Emojis.Stopped.value} Next MVP at -- in --'
+
+    if spreadsheet_id == os.getenv('SPREADSHEET_HIGH_LVL_ID'):
+        level_text = 'Anywhere'
+    else:
+        level_text = 'Mushroom Shrine'
+
+    # Create a new layout, else continue adding to the current one
+    if not layout:
+        layout = EmbedLayout(title=f'**Upcoming MVPs • {date_time.strftime("%D %I:%M %p")} UTC**')
+
+    layout.add_field(name=Emojis.Spacer.value, value=f'```\n{level_text} MVPs\n```\n{top_value}', inline=False)
+
+    pac_col = get_timezone_col('pacific')
+    east_col = get_timezone_col('eastern')
+    cen_e_col = get_timezone_col('central europe')
+    aus_col = get_timezone_col('australia')
+
+    first_set = False
+    for slot in sheet:
+        if SlotKey.Reset.value == slot.key:
+            layout.add_field(name='**Server Reset**', value=f'{slot.single_time.strftime("%I:%M %p")}  UTC', inline=False)
+
+        elif SlotKey.Unscheduled.value == slot.key:
+            layout.add_field(name='**Unscheduled**', value=f'{Emojis.Unscheduled.value} {slot.start_date.strftime("%I:%M %p")} UTC -- '
+                                                       f'{slot.last_date.strftime("%I:%M %p")} UTC', inline=False)
+        else:
+            embed_lines = []
+            for mvp_time in slot.mvp_times:
+                if not first_set:
+                    first_set = True
+                    emoji = Emojis.Next.value
+                else:
+                    emoji = Emojis.Scheduled.value
+
+                embed_lines.append(f'{emoji} {mvp_time["row"][6]} UTC - {mvp_time["row"][pac_col]} {col_to_tz[pac_col]} - {mvp_time["row"][east_col]} {col_to_tz[east_col]} - '
+                                   f'{mvp_time["row"][cen_e_col]} {col_to_tz[cen_e_col]} - {mvp_time["row"][aus_col]} {col_to_tz[aus_col]}\n')
+
+            # Lines that overflow the maximum allowed characters in an embed field are moved onto a new block
+            layout.add_lines(name=f'**{slot.key} • {"IGN: " + slot.ign + " " if slot.ign else ""}{"Discord: " + slot.discord if slot.discord else ""}**',
+                             lines=embed_lines, inline=False)
+
+    return layout
+
+
+def build_open_slots_embed(date_time, search_slots, spreadsheet_id):
+    Emojis = get_emojis()
+    next_day_trigger = datetime.now(timezone.utc).replace(hour=18, minute=0, second=0)
+
+    if date_time >= next_day_trigger:
+        # If the sheet does not exist yet - build it, the cached schedule already knows which tabs are missing
+        schedule = load_schedule(spreadsheet_id, date_time, date_time + schedule_lookahead)
+        if get_tomorrows_date().strftime('%D') in schedule.missing_days:
+            build_tomorrow_sheet(spreadsheet_id)
+
+    # Open slots are searched for across all of the upcoming days, not just today and tomorrow
+    open_slots = group_by_day(find_open_slots(spreadsheet_id, date_time, search_slots), SlotKey.Unscheduled.value)
+
+    layout = EmbedLayout(title=f'Open MVP Timeslots • <t:{int(date_time.timestamp())}> Local Time',
+                         description=f'Showing the next {search_slots} timeslots')
+
+    for slot in open_slots:
+        if SlotKey.Reset.value == slot.key:
+            layout.add_field(name='Server Reset', value=f'<t:{int(slot.single_time.timestamp())}:t> Local Time', inline=False)
+        else:
+            layout.add_lines(name=slot.key, lines=[f'{Emojis.Unscheduled.value} {mvp_time["dt"].strftime("%I:%M %p")} UTC • '
+                                                   f'<t:{int(mvp_time["dt"].timestamp())}:t> Local Time\n' for mvp_time in slot.mvp_times], inline=False)
+
+    return layout
+
+
+def build_player_embed(date_time, player, spreadsheet_ids):
+    Emojis = get_emojis()
+    layout = EmbedLayout(title=f'Scheduled MVPs for {player} • <t:{int(date_time.timestamp())}> Local Time',
+                         description=f'Showing the next {schedule_lookahead.days} days')
+
+    for spreadsheet_id in spreadsheet_ids:
+        if spreadsheet_id == os.getenv('SPREADSHEET_HIGH_LVL_ID'):
+            level_text = 'Anywhere'
+        else:
+            level_text = 'Mushroom Shrine'
+
+        # Merge back to back slots on the same ch/map into a single line
+        slot_runs = []
+        for slot in find_player_slots(spreadsheet_id, date_time, player):
+            key_ = f'Ch {slot["row"][4]} {slot["row"][3] if slot["row"][3] else "Mushroom Shrine"}'
+            if slot_runs and slot_runs[-1].key == key_ and slot['dt'] - slot_runs[-1].mvp_times[-1]['dt'] <= timedelta(minutes=15):
+                slot_runs[-1].add(slot['row'], slot['dt'])
+            else:
+                slot_runs.append(MVPTimes(key=key_))
+                slot_runs[-1].add(slot['row'], slot['dt'])
+
+        embed_lines = [f'{Emojis.Scheduled.value} <t:{int(slot_run.mvp_times[0]["dt"].timestamp())}:f> -- '
+                       f'<t:{int(slot_run.mvp_times[-1]["dt"].timestamp())}:t> • {slot_run.key}\n' for slot_run in slot_runs]
+        layout.add_lines(name=f'**{level_text} MVPs**', lines=embed_lines or [f'{Emojis.Stopped.value} Nothing scheduled'], inline=False)
+
+    return layout
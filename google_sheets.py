@@ -1,15 +1,22 @@
 import os.path
 import pickle
 
-from google.auth.transport.requests import Request
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
+# The service is built on first use so importing this module does not pull in the google client libraries
+service = None
+
 
 def get_service():
+    global service
+    if service:
+        return service
+
+    from google.auth.transport.requests import Request
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from googleapiclient.discovery import build
+
     creds = None
     # The file token.pickle stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
@@ -28,7 +35,9 @@ def get_service():
         with open('token.pickle', 'wb') as token:
             pickle.dump(creds, token)
 
-    return build('sheets', 'v4', credentials=creds)
+    # The credentials are refreshed by the service itself once they expire
+    service = build('sheets', 'v4', credentials=creds)
+    return service
 
 
 def create_sheet(sheet_name, spreadsheet_id):
@@ -86,3 +95,22 @@ def get_sheet_data(get_range, spreadsheet_id):
         return result.get('values', [])
     except:
         return []
+
+
+def get_sheet_names(spreadsheet_id):
+    try:
+        sheet = get_service().spreadsheets()
+        # Only ask for the tab titles, the rest of the metadata grows with every day tab that is added
+        result = sheet.get(spreadsheetId=spreadsheet_id, fields='sheets.properties.title').execute()
+        return [sheet.get('properties', {}).get('title', '') for sheet in result.get('sheets', [])]
+    except:
+        return None
+
+
+def get_sheet_data_batch(get_ranges, spreadsheet_id):
+    try:
+        sheet = get_service().spreadsheets()
+        result = sheet.values().batchGet(spreadsheetId=spreadsheet_id, ranges=get_ranges).execute()
+        return [value_range.get('values', []) for value_range in result.get('valueRanges', [])]
+    except:
+        return None
@@ -0,0 +1,497 @@
+"""
+Offline load test harness for MVPBot
+
+Replays the scheduled mvp post and bursts of user commands against in-process stand-ins for Google Sheets,
+Discord and MongoDB (mongomock) so that nothing leaves the machine.
+
+Usage:
+    python load_test.py --channels 5000 --passes 3 --bursts 10 --burst-size 50 --discord-latency 0.05
+
+Recorded days can be replayed with --days, a json file mapping sheet tab names to the rows returned by the
+Sheets values api. They are served in order starting from today's tab.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import mongomock
+
+import MVPBot
+import embeds
+import google_sheets
+
+TEMPLATE_SHEET = 'Copy Me!'
+MAPS = ['', 'Henesys', 'Ellinia', 'Perion', 'Kerning City', 'Leafre']
+
+
+class FakeHTTPError(Exception):
+    pass
+
+
+class RateLimiter:
+    """
+    Token bucket used to mimic discord's rate limits, requests over the limit wait for a token like discord.py does on a 429
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.perf_counter()
+        self.throttled = 0
+
+    async def acquire(self):
+        if not self.rate:
+            return
+        throttled = False
+        while True:
+            now = time.perf_counter()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                # Count each request that had to wait once, however many times it woke up before getting a token
+                self.throttled += throttled
+                return
+            throttled = True
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def build_synthetic_day(rng, fill):
+    """
+    Builds the rows of a single day tab in the same shape as the values returned from the google sheet
+    :param rng: Random generator used to fill slots
+    :param fill: Chance that any 15 minute slot is scheduled
+    :return:
+    """
+    rows = [['MVP Schedule'], ['Discord', 'IGN', '', 'Map', 'Ch', '', 'UTC'] + [embeds.col_to_tz[col] for col in range(7, 17)]]
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    for slot in range(96):
+        slot_time = start + timedelta(minutes=slot * 15)
+        # Scheduled rows are kept together in runs the same way people book a few slots in a row
+        if slot % 4 == 0:
+            booked = rng.random() < fill
+            user = rng.randrange(1000)
+            ch = str(rng.randrange(1, 41))
+            map_name = rng.choice(MAPS)
+        tz_times = [(slot_time + timedelta(hours=offset)).strftime('%I:%M %p') for offset in (-8, -7, -6, -5, -5, -4, 2, 3, 10, 11)]
+        if booked:
+            rows.append([f'user#{user:04}', f'Ign{user}', '', map_name, ch, '', slot_time.strftime('%I:%M %p')] + tz_times)
+        else:
+            rows.append(['', '', '', '', '', '', slot_time.strftime('%I:%M %p')] + tz_times)
+    return rows
+
+
+class FakeRequest:
+    def __init__(self, sheets, name, response):
+        self.sheets = sheets
+        self.name = name
+        self.response = response
+
+    def execute(self):
+        self.sheets.counts[f'sheets.{self.name}'] += 1
+        if self.sheets.latency:
+            # The real client is synchronous, so block the same way it would
+            time.sleep(self.sheets.latency)
+        return self.response()
+
+
+class FakeSheets:
+    """
+    In process stand in for the Sheets api service returned by google_sheets.get_service, serves synthetic or recorded day tabs
+    """
+
+    def __init__(self, recorded_days=None, latency=0.0, fill=0.6, seed=0, days_ahead=14):
+        self.recorded_days = list(recorded_days.values()) if recorded_days else []
+        self.latency = latency
+        self.fill = fill
+        self.rng = random.Random(seed)
+        self.days_ahead = len(self.recorded_days) if self.recorded_days else days_ahead
+        self.days = {}
+        self.counts = Counter()
+
+    def _tabs(self, spreadsheet_id):
+        today = datetime.now(timezone.utc)
+        tabs = [TEMPLATE_SHEET] + [(today + timedelta(days=offset)).strftime('%D') for offset in range(self.days_ahead)]
+        tabs.extend(sheet_name for sheet_id, sheet_name in self.days if sheet_id == spreadsheet_id and sheet_name not in tabs)
+        return tabs
+
+    def _day(self, spreadsheet_id, sheet_name):
+        key = (spreadsheet_id, sheet_name)
+        if key not in self.days:
+            if sheet_name not in self._tabs(spreadsheet_id):
+                raise FakeHTTPError(f'Unable to parse range: {sheet_name}')
+            offset = (datetime.strptime(sheet_name, '%m/%d/%y').date() - datetime.now(timezone.utc).date()).days
+            if self.recorded_days:
+                self.days[key] = self.recorded_days[offset]
+            else:
+                self.days[key] = build_synthetic_day(self.rng, self.fill)
+        return self.days[key]
+
+    def _batch_update(self, spreadsheet_id, body):
+        for request in body.get('requests', []):
+            if 'addSheet' in request:
+                self.days[(spreadsheet_id, request['addSheet']['properties']['title'])] = build_synthetic_day(self.rng, 0)
+        return {}
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return FakeValues(self)
+
+    def get(self, spreadsheetId, fields=None):
+        def response():
+            if fields == 'sheets.properties.title':
+                return {'sheets': [{'properties': {'title': title}} for title in self._tabs(spreadsheetId)]}
+            return {'sheets': [{'properties': {'title': title, 'sheetId': index}} for index, title in enumerate(self._tabs(spreadsheetId))]}
+        return FakeRequest(self, 'spreadsheets.get', response)
+
+    def batchUpdate(self, spreadsheetId, body):
+        return FakeRequest(self, 'spreadsheets.batchUpdate', lambda: self._batch_update(spreadsheetId, body))
+
+
+class FakeValues:
+    def __init__(self, sheets):
+        self.sheets = sheets
+
+    def get(self, spreadsheetId, range):
+        return FakeRequest(self.sheets, 'values.get', lambda: {'values': self.sheets._day(spreadsheetId, range.split('!')[0])})
+
+    def batchGet(self, spreadsheetId, ranges):
+        return FakeRequest(self.sheets, 'values.batchGet', lambda: {'valueRanges': [{'values': self.sheets._day(spreadsheetId, get_range.split('!')[0])}
+                                                                                    for get_range in ranges]})
+
+
+class FakeDiscord:
+    """
+    Shared state for the fake discord objects, latency and rate limits are applied to every rest call
+    """
+
+    def __init__(self, latency=0.0, rate=50, burst=50):
+        self.latency = latency
+        self.limiter = RateLimiter(rate, burst)
+        self.counts = Counter()
+        self.next_id = 1
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    async def request(self, route):
+        self.counts[f'discord.{route}'] += 1
+        await self.limiter.acquire()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeUser:
+    def __init__(self, user_id, name='user'):
+        self.id = user_id
+        self.name = name
+
+
+class FakeGuild:
+    def __init__(self, guild_id, me=None):
+        self.id = guild_id
+        self.me = me
+
+
+class FakeMessage:
+    def __init__(self, discord, channel, author, embed=None, content=None):
+        self.discord = discord
+        self.id = discord.new_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.embed = embed
+        self.content = content
+
+    async def edit(self, embed=None, content=None):
+        await self.discord.request('edit_message')
+        self.embed = embed
+
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, embed=None, content=None):
+        await self.channel.discord.request('edit_message')
+        if self.id not in self.channel.messages:
+            raise FakeHTTPError('Unknown Message')
+        self.channel.messages[self.id].embed = embed
+
+    async def delete(self):
+        await self.channel.discord.request('delete_message')
+        if self.channel.messages.pop(self.id, None) is None:
+            raise FakeHTTPError('Unknown Message')
+
+
+class FakeChannel:
+    def __init__(self, discord, channel_id, guild, bot_user, failing=False, missing_permission=None):
+        self.discord = discord
+        self.id = channel_id
+        self.guild = guild
+        self.bot_user = bot_user
+        # Posts to a failing channel always fail, whether or not it is missing one of the permissions needed to post
+        self.failing = failing
+        self.permissions = {'send_messages': True, 'embed_links': True, 'read_message_history': True}
+        if missing_permission:
+            self.permissions[missing_permission] = False
+        self.last_message_id = None
+        self.messages = {}
+
+    async def fetch_message(self, message_id):
+        await self.discord.request('fetch_message')
+        if message_id not in self.messages:
+            raise FakeHTTPError('Unknown Message')
+        return self.messages[message_id]
+
+    def permissions_for(self, member):
+        return SimpleNamespace(**self.permissions)
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def send(self, content=None, embed=None, author=None):
+        await self.discord.request('send_message')
+        if self.failing:
+            raise FakeHTTPError('Missing Access')
+        message = FakeMessage(self.discord, self, author or self.bot_user, embed, content)
+        self.messages[message.id] = message
+        self.last_message_id = message.id
+        return message
+
+
+class FakeBot:
+    def __init__(self, user):
+        self.user = user
+        self.channels = {}
+        self._before_invoke = None
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def can_run(self, ctx):
+        return True
+
+
+class FakeContext:
+    def __init__(self, bot, channel, author, command, content):
+        self.bot = bot
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.command = command
+        self.message = FakeMessage(channel.discord, channel, author, content=content)
+
+    async def send(self, content=None, embed=None):
+        return await self.channel.send(content=content, embed=embed)
+
+
+class CountingCollection:
+    def __init__(self, collection, counts):
+        self.collection = collection
+        self.counts = counts
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            self.counts[f'mongo.{name}'] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+class CountingDatabase:
+    def __init__(self, database, counts):
+        self.database = database
+        self.counts = counts
+
+    def __getattr__(self, name):
+        return CountingCollection(getattr(self.database, name), self.counts)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        recorded_days = None
+        if args.days:
+            with open(args.days) as days_file:
+                recorded_days = json.load(days_file)
+        self.sheets = FakeSheets(recorded_days, args.sheets_latency, args.fill, args.seed)
+        self.discord = FakeDiscord(args.discord_latency, args.rate_limit, args.rate_burst)
+        self.mongo_counts = Counter()
+        self.bot = FakeBot(FakeUser(1, 'MVPBot'))
+        self.guilds = []
+        self.channels = []
+        self.pass_durations = []
+        self.command_latencies = []
+        self.outcomes = Counter()
+
+    def install(self):
+        """
+        Swap the live services used by MVPBot for the fakes
+        """
+        # The real spreadsheet ids are never used, but they must be set to tell the two spreadsheets apart
+        os.environ.setdefault('SPREADSHEET_HIGH_LVL_ID', 'anywhere-spreadsheet')
+        os.environ.setdefault('SPREADSHEET_LOW_LVL_ID', 'mushroom-shrine-spreadsheet')
+        MVPBot.load_config()
+        MVPBot.client = SimpleNamespace(mvpbot=CountingDatabase(mongomock.MongoClient().mvpbot, self.mongo_counts))
+        MVPBot.bot = self.bot
+        google_sheets.get_service = lambda: self.sheets
+        embeds.timezones.update(MVPBot.load_daylight_settings())
+
+    def seed(self):
+        args = self.args
+        channel_id = 10 ** 6
+        for guild_index in range(args.guilds):
+            guild = FakeGuild(10 ** 5 + guild_index, self.bot.user)
+            self.guilds.append(guild)
+            MVPBot.get_db().whitelist.insert_one({'name': f'guild{guild_index}', 'server_id': str(guild.id), 'registered_chs': []})
+
+        for channel_index in range(args.channels):
+            channel_id += 1
+            guild = self.guilds[channel_index % len(self.guilds)]
+            registered = MVPBot.get_db().channels.insert_one({'channel_id': channel_id})
+            MVPBot.get_db().whitelist.update_one({'server_id': str(guild.id)}, {'$push': {'registered_chs': registered.inserted_id}})
+            # Some channels are deleted or hidden from the bot, the rest are visible and some of those can not be sent to
+            if self.rng.random() < args.missing:
+                continue
+            failing = self.rng.random() < args.failing
+            # Half of the failing channels look like they can be posted to, the rest are missing a permission
+            missing_permission = None
+            if failing and self.rng.random() < 0.5:
+                missing_permission = self.rng.choice(['send_messages', 'embed_links', 'read_message_history'])
+            channel = FakeChannel(self.discord, channel_id, guild, self.bot.user, failing=failing, missing_permission=missing_permission)
+            self.bot.channels[channel_id] = channel
+            self.channels.append(channel)
+        self.mongo_counts.clear()
+
+    async def run_pass(self):
+        start = time.perf_counter()
+        await MVPBot.scheduled_mvp.coro()
+        self.pass_durations.append(time.perf_counter() - start)
+
+    async def run_command(self, command, *args, **kwargs):
+        channel = self.rng.choice(self.channels)
+        author = FakeUser(10 ** 7 + self.rng.randrange(self.args.users))
+        ctx = FakeContext(self.bot, channel, author, command, f'!!{command.name} {" ".join(map(str, args + tuple(kwargs.values())))}'.strip())
+        start = time.perf_counter()
+        try:
+            if await command.can_run(ctx):
+                await command.call_before_hooks(ctx)
+                await command.callback(ctx, *args, **kwargs)
+                self.outcomes['ok'] += 1
+            else:
+                self.outcomes['rejected'] += 1
+        except MVPBot.commands.CommandError as e:
+            self.outcomes[type(e).__name__] += 1
+        except Exception as e:
+            self.outcomes[f'error.{type(e).__name__}'] += 1
+        self.command_latencies.append(time.perf_counter() - start)
+
+    async def run_burst(self):
+        burst = []
+        for _ in range(self.args.burst_size):
+            choice = self.rng.random()
+            if choice < 0.4:
+                burst.append(self.run_command(MVPBot.get_mvp))
+            elif choice < 0.5:
+                burst.append(self.run_command(MVPBot.get_player_schedule, player=f'Ign{self.rng.randrange(1000)}'))
+            elif choice < 0.8:
+                burst.append(self.run_command(MVPBot.get_mushroome_shrine_timeslots, self.rng.randint(1, self.args.max_slots)))
+            else:
+                burst.append(self.run_command(MVPBot.get_anywhere_timeslots, self.rng.randint(1, self.args.max_slots)))
+        await asyncio.gather(*burst)
+
+    async def run(self):
+        start = time.perf_counter()
+        for _ in range(self.args.passes):
+            await self.run_pass()
+        if self.args.reconcile:
+            await MVPBot.reconcile_channels.coro()
+        for _ in range(self.args.bursts):
+            await self.run_burst()
+        return time.perf_counter() - start
+
+    def report(self, total):
+        lines = [f'Total time: {total:.3f}s',
+                 f'Channels: {self.args.channels} registered, {len(self.channels)} visible',
+                 f'Passes: {len(self.pass_durations)}']
+        if self.pass_durations:
+            lines.append(f'Pass duration: min {min(self.pass_durations):.3f}s, mean {sum(self.pass_durations) / len(self.pass_durations):.3f}s, '
+                         f'max {max(self.pass_durations):.3f}s')
+        lines.append(f'Commands: {len(self.command_latencies)} {dict(self.outcomes)}')
+        if self.command_latencies:
+            lines.append(f'Command latency: p50 {percentile(self.command_latencies, 50) * 1000:.1f}ms, '
+                         f'p99 {percentile(self.command_latencies, 99) * 1000:.1f}ms')
+        channels = MVPBot.get_db().channels
+        lines.append(f'Subscriptions: {channels.count_documents({"suspended": {"$ne": True}, "failures": {"$exists": False}})} healthy, '
+                     f'{channels.count_documents({"suspended": {"$ne": True}, "failures": {"$exists": True}})} backing off, '
+                     f'{channels.count_documents({"suspended": True})} suspended')
+        lines.append(f'Discord rate limited requests: {self.discord.limiter.throttled}')
+        lines.append('API calls:')
+        counts = self.sheets.counts + self.discord.counts + self.mongo_counts
+        for name, count in sorted(counts.items()):
+            lines.append(f'  {name}: {count}')
+        return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Offline load test for the MVPBot scheduled post and commands')
+    parser.add_argument('--channels', type=int, default=1000, help='Number of registered channels')
+    parser.add_argument('--guilds', type=int, default=100, help='Number of whitelisted guilds the channels are spread across')
+    parser.add_argument('--users', type=int, default=500, help='Number of distinct users issuing commands')
+    parser.add_argument('--missing', type=float, default=0.0, help='Fraction of registered channels the bot can not see')
+    parser.add_argument('--failing', type=float, default=0.0, help='Fraction of visible channels where sending fails')
+    parser.add_argument('--passes', type=int, default=1, help='Number of scheduled mvp passes to run')
+    parser.add_argument('--reconcile', action='store_true', help='Run the channel reconciliation after the passes')
+    parser.add_argument('--bursts', type=int, default=5, help='Number of command bursts to run')
+    parser.add_argument('--burst-size', type=int, default=50, help='Number of concurrent commands in each burst')
+    parser.add_argument('--max-slots', type=int, default=10, help='Largest number of slots requested by the timeslots commands')
+    parser.add_argument('--fill', type=float, default=0.6, help='Chance a synthetic hour is scheduled')
+    parser.add_argument('--days', help='Json file of recorded day tabs to replay instead of synthetic days')
+    parser.add_argument('--sheets-latency', type=float, default=0.0, help='Seconds added to every Sheets call')
+    parser.add_argument('--discord-latency', type=float, default=0.0, help='Seconds added to every Discord call')
+    parser.add_argument('--rate-limit', type=float, default=50, help='Discord requests per second before waiting, 0 disables')
+    parser.add_argument('--rate-burst', type=int, default=50, help='Discord requests allowed in a single burst')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data')
+    parser.add_argument('--verbose', action='store_true', help='Show the output printed by the bot')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    harness = Harness(args)
+    harness.install()
+    harness.seed()
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, 'w'))))
+        total = asyncio.get_event_loop().run_until_complete(harness.run())
+    print(harness.report(total))
+
+
+if __name__ == '__main__':
+    main()
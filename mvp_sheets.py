@@ -0,0 +1,303 @@
+import logging
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+
+from google_sheets import get_sheet_data, get_sheet_data_batch, get_sheet_names, create_sheet, copy_paste, get_sheetid
+from utilities import MVPGap, MVPTimes, SlotKey
+
+logger = logging.getLogger('discord')
+
+mvp_gap_size = 2
+mvp_gap_delta = timedelta(minutes=mvp_gap_size * 15)
+
+# How long a parsed day tab is reused before it is fetched again, and how far ahead the schedule queries look by default
+day_cache_ttl = timedelta(minutes=1)
+schedule_lookahead = timedelta(days=7)
+
+
+def get_tomorrows_date():
+    return datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+def filter_sheet(filter_start_date, mvp_sheet, search_slots=0):
+    """
+
+    :param filter_start_date: The date that all rows must be past
+    :param mvp_sheet: The represntation of the google sheet
+    :param search_slots: The number of unfilled mvp slots to find
+    :return:
+    """
+    filtered_sheet = []
+    open_mvp_slots = MVPTimes(key=SlotKey.Unscheduled.value)
+    next_mvp_time = None
+    if len(mvp_sheet) >= 2:
+        latest_mvp = filter_start_date
+        current_map_ch = MVPTimes()
+        current_gap = MVPGap()
+        for mvp_row in mvp_sheet[2:]:
+            try:
+                new_time = datetime.strptime(mvp_row[6], "%I:%M %p").replace(tzinfo=timezone.utc)
+                base_time = new_time.timetz()
+                new_datetime = datetime.combine(filter_start_date.date(), base_time)
+                # Start by only looking at rows past the current date
+                if new_datetime >= filter_start_date:
+                    if mvp_row[4]:
+                        # Calculate the how much longer until the next mvp
+                        if not current_map_ch.key and len(filtered_sheet) == 0:
+                            next_mvp_time = new_datetime - latest_mvp
+
+                        # Save the latest mvp time to determine gaps
+                        latest_mvp = new_datetime
+
+                        # If the gap is large enough to save, add the gap to the sheet and start a new one
+                        if current_gap.gap_size >= mvp_gap_size:
+                            filtered_sheet.append(current_gap)
+                            current_gap = MVPGap()
+                        else:
+                            current_gap = MVPGap()
+
+                        key_ = f'Ch {mvp_row[4]} {mvp_row[3] if mvp_row[3] else "Mushroom Shrine"}'
+                        # Determine if the current row matches the previously determined ones
+                        if key_ == current_map_ch.key and current_map_ch.discord == mvp_row[0] and current_map_ch.ign == mvp_row[1]:
+                            current_map_ch.add(mvp_row, new_datetime)
+                        else:
+                            if current_map_ch.key:
+                                # Add the set of rows to the sheet and set up the new key
+                                filtered_sheet.append(current_map_ch)
+                                current_map_ch = MVPTimes()
+                            # Setup the new row/MVPTimes
+                            current_map_ch.key = key_
+                            current_map_ch.discord = mvp_row[0]
+                            current_map_ch.ign = mvp_row[1]
+                            current_map_ch.add(mvp_row, new_datetime)
+                    else:
+                        # Determine the gap lengths
+                        if not current_gap.start_date:
+                            current_gap.start_date = new_datetime
+                            current_gap.last_date = new_datetime
+                            current_gap.gap_size += 1
+                        else:
+                            current_gap.last_date = new_datetime
+                            current_gap.gap_size += 1
+
+                        # If the gap is large enough to save, add the current mvp set to the sheet and start a new one
+                        if current_map_ch.key and current_gap.gap_size >= mvp_gap_size:
+                            filtered_sheet.append(current_map_ch)
+                            current_map_ch = MVPTimes()
+
+                        # Add the open mvp slots if we are searching for them
+                        if len(open_mvp_slots.mvp_times) < search_slots:
+                            open_mvp_slots.add(mvp_row, new_datetime)
+            except:
+                logger.error(f"Error occurred when attempting to filter row {mvp_row}")
+
+        # Add the ending set of mvps if they exist
+        if current_map_ch.key:
+            filtered_sheet.append(current_map_ch)
+
+    return filtered_sheet, next_mvp_time, [open_mvp_slots]
+
+
+def get_todays_sheet(spreadsheet_id, search_slots=0):
+    """
+    :param spreadsheet_id: The id of sheet to get information from
+    :param search_slots: The number of unfilled mvp slots to find
+    :return:
+    """
+    current_date = datetime.now(timezone.utc)
+    return filter_sheet(current_date, get_sheet_data(f'{current_date.strftime("%D")}!A:Z', spreadsheet_id), search_slots)
+
+
+def get_tomorrows_sheet(spreadsheet_id, search_slots=0):
+    """
+    :param spreadsheet_id: The id of sheet to get information from
+    :param search_slots: The number of unfilled mvp slots to find
+    :return:
+    """
+    tomorrows_date = get_tomorrows_date()
+    return filter_sheet(tomorrows_date, get_sheet_data(f'{tomorrows_date.strftime("%D")}!A:Z', spreadsheet_id), search_slots)
+
+
+def get_both_sheets(spreadsheet_id, search_slots=0):
+    """
+    Get today + tomorrows google sheets filtered down
+    :param spreadsheet_id: The id of sheet to get information from
+    :param search_slots: The number of unfilled mvp slots to find
+    :return:
+    """
+    # If we are getting both sheets, then we are in the reset period so pass in true to todays sheet
+    current_sheet, next_mvp_time, open_slots = get_todays_sheet(spreadsheet_id, search_slots)
+
+    # Calculate the number of slots to search for
+    search_slots = search_slots - len(open_slots) if len(open_slots) < search_slots else 0
+
+    # Add the reset time split for mvps as well as open slots
+    reset_mvp_time = MVPTimes(SlotKey.Reset.value, get_tomorrows_date())
+    current_sheet.append(reset_mvp_time)
+    open_slots.append(reset_mvp_time)
+
+    # Get the mvp sheet and open slots for the next day if needed
+    next_sheet, reset_mvp_time, next_open_slots = get_tomorrows_sheet(spreadsheet_id, search_slots)
+    current_sheet.extend(next_sheet)
+    open_slots.extend(next_open_slots)
+
+    # Determine time to next mvp around across reset boundary which is
+    # Time between now and reset + the time between reset and the next mvp
+    if not next_mvp_time and reset_mvp_time:
+        next_mvp_time = (get_tomorrows_date() - datetime.now(timezone.utc)) + reset_mvp_time
+
+    return current_sheet, next_mvp_time, open_slots
+
+
+def build_tomorrow_sheet(spreadsheet_id):
+    tomorrow_date = get_tomorrows_date()
+    if create_sheet(tomorrow_date.strftime('%D'), spreadsheet_id):
+        copy_from_id = get_sheetid('Copy Me!', spreadsheet_id)
+        copy_to_id = get_sheetid(tomorrow_date.strftime('%D'), spreadsheet_id)
+        copy_paste(copy_from_id, copy_to_id, spreadsheet_id)
+        # The new tab is no longer missing, so fetch it on the next query
+        schedules.pop(spreadsheet_id, None)
+
+
+class Schedule:
+    """
+    Class for storing the parsed day tabs of a spreadsheet merged into a single time ordered index
+    """
+
+    def __init__(self):
+        self.days = {}
+        self.missing_days = set()
+        self.slots = []
+        self.times = []
+
+    def stale_days(self, sheet_names, current_date):
+        return [sheet_name for sheet_name in sheet_names if sheet_name not in self.days or current_date - self.days[sheet_name][0] >= day_cache_ttl]
+
+    def update(self, parsed_days, current_date, missing_days=()):
+        for sheet_name, slots in parsed_days.items():
+            self.days[sheet_name] = (current_date, slots)
+        # Remember which days had no tab so callers can tell without asking the api again
+        self.missing_days = (self.missing_days - set(parsed_days)) | set(missing_days)
+
+        # Drop the days that have already passed before rebuilding the index
+        yesterday = (current_date - timedelta(days=1)).date()
+        for sheet_name in list(self.days):
+            if datetime.strptime(sheet_name, '%m/%d/%y').date() < yesterday:
+                del self.days[sheet_name]
+
+        self.missing_days &= set(self.days)
+        self.slots = sorted((slot for _, slots in self.days.values() for slot in slots), key=lambda slot: slot['dt'])
+        self.times = [slot['dt'] for slot in self.slots]
+
+    def window(self, start_date, end_date):
+        return self.slots[bisect_left(self.times, start_date):bisect_left(self.times, end_date)]
+
+
+# Spreadsheet id to its Schedule
+schedules = {}
+
+
+def parse_day(sheet_date, mvp_sheet):
+    """
+    Parse the rows of a day tab into time slots
+    :param sheet_date: The date of the day tab
+    :param mvp_sheet: The represntation of the google sheet
+    :return:
+    """
+    slots = []
+    for mvp_row in mvp_sheet[2:]:
+        try:
+            base_time = datetime.strptime(mvp_row[6], "%I:%M %p").replace(tzinfo=timezone.utc).timetz()
+            slots.append({'row': mvp_row, 'dt': datetime.combine(sheet_date, base_time)})
+        except:
+            logger.error(f"Error occurred when attempting to parse row {mvp_row}")
+    return slots
+
+
+def load_schedule(spreadsheet_id, start_date, end_date):
+    """
+    Get the schedule covering the day tabs between two dates, only fetching the days that are missing or stale
+    :param spreadsheet_id: The id of sheet to get information from
+    :param start_date: The start of the window
+    :param end_date: The end of the window
+    :return:
+    """
+    schedule = schedules.setdefault(spreadsheet_id, Schedule())
+    current_date = datetime.now(timezone.utc)
+    sheet_names = [(start_date + timedelta(days=day)).strftime('%D') for day in range((end_date.date() - start_date.date()).days + 1)]
+    stale_days = schedule.stale_days(sheet_names, current_date)
+    if not stale_days:
+        return schedule
+
+    # One call to find which day tabs exist and one to fetch all of them, rather than a call per day
+    existing_sheets = get_sheet_names(spreadsheet_id)
+    if existing_sheets is None:
+        return schedule
+    fetch_days = [sheet_name for sheet_name in stale_days if sheet_name in existing_sheets]
+    mvp_sheets = get_sheet_data_batch([f'{sheet_name}!A:Z' for sheet_name in fetch_days], spreadsheet_id) if fetch_days else []
+    if mvp_sheets is None:
+        return schedule
+
+    # Days without a tab yet have nothing scheduled
+    parsed_days = {sheet_name: [] for sheet_name in stale_days}
+    for sheet_name, mvp_sheet in zip(fetch_days, mvp_sheets):
+        parsed_days[sheet_name] = parse_day(datetime.strptime(sheet_name, '%m/%d/%y').date(), mvp_sheet)
+    schedule.update(parsed_days, current_date, [sheet_name for sheet_name in stale_days if sheet_name not in existing_sheets])
+    return schedule
+
+
+def query_schedule(spreadsheet_id, start_date, end_date=None, match=None, limit=None):
+    """
+    Find the time slots within a window of the schedule
+    :param spreadsheet_id: The id of sheet to get information from
+    :param start_date: The start of the window
+    :param end_date: The end of the window, defaults to the schedule lookahead
+    :param match: Function that a slot's row must pass to be returned
+    :param limit: The most slots to return
+    :return:
+    """
+    end_date = end_date or start_date + schedule_lookahead
+    slots = []
+    for slot in load_schedule(spreadsheet_id, start_date, end_date).window(start_date, end_date):
+        if not match or match(slot['row']):
+            slots.append(slot)
+            if limit and len(slots) >= limit:
+                break
+    return slots
+
+
+def find_open_slots(spreadsheet_id, start_date, search_slots, end_date=None):
+    return query_schedule(spreadsheet_id, start_date, end_date, lambda mvp_row: not mvp_row[4], search_slots)
+
+
+def find_channel_slots(spreadsheet_id, start_date, ch=None, map_name=None, end_date=None):
+    def match(mvp_row):
+        if not mvp_row[4] or (ch and mvp_row[4] != str(ch)):
+            return False
+        return not map_name or (mvp_row[3] or 'Mushroom Shrine').lower() == map_name.lower()
+
+    return query_schedule(spreadsheet_id, start_date, end_date, match)
+
+
+def find_player_slots(spreadsheet_id, start_date, player, end_date=None):
+    player = player.lower()
+    return query_schedule(spreadsheet_id, start_date, end_date, lambda mvp_row: mvp_row[4] and player in (mvp_row[0].lower(), mvp_row[1].lower()))
+
+
+def group_by_day(slots, key):
+    """
+    Group time slots into one MVPTimes per day with the server resets between them
+    :param slots: The time ordered slots
+    :param key: The key of each group
+    :return:
+    """
+    groups = []
+    current_group = None
+    for slot in slots:
+        if not current_group or current_group.mvp_times[-1]['dt'].date() != slot['dt'].date():
+            if current_group:
+                groups.append(MVPTimes(SlotKey.Reset.value, datetime.combine(slot['dt'].date(), datetime.min.time(), timezone.utc)))
+            current_group = MVPTimes(key=key)
+            groups.append(current_group)
+        current_group.add(slot['row'], slot['dt'])
+    return groups
@@ -1,3 +1,4 @@
+import os
 from datetime import datetime
 from enum import Enum
 
@@ -30,6 +31,13 @@ class Emojis_dev(Enum):
     Spacer = '<:spacer_dev:870842729779834940>'
 
 
+def get_emojis():
+    # Used to load emojis from a different server for development
+    if int(os.getenv('IS_DEV') or 0):
+        return Emojis_dev
+    return Emojis
+
+
 class SlotKey(Enum):
     Reset = 'Reset'
     Unscheduled = 'Unscheduled'